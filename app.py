@@ -1,6 +1,29 @@
 import streamlit as st
+from embeddings import OnnxEmbedding
 from main import RAGApplication  
 
+# Number of streamed tokens to accumulate between re-renders of the response
+TOKENS_PER_RENDER = 20
+
+@st.cache_resource
+def get_embed_model():
+    """
+    Load the embedding model once and share it across reruns and sessions
+    """
+    return OnnxEmbedding(model_name="BAAI/bge-small-en-v1.5")
+
+@st.cache_resource
+def get_rag(pdf_path: str, llm_model: str, groq_api_key: str):
+    """
+    Build the RAG application once per (PDF, model, API key) combination
+    """
+    return RAGApplication(
+        pdf_path=pdf_path, 
+        groq_api_key=groq_api_key, 
+        embed_model=get_embed_model(),
+        llm_model=llm_model
+    )
+
 # Streamlit app setup
 def main():
     st.title("Data Visualization Expert :bar_chart:")
@@ -20,7 +43,11 @@ def main():
     pdf_path = st.sidebar.text_input("Enter the path to your PDF document", "data/The Big Book of Dashboards.pdf")
     
     # Create RAG application instance
-    rag_app = RAGApplication(pdf_path=pdf_path, groq_api_key=groq_api_key, llm_model=selected_llm)
+    rag_app = get_rag(pdf_path, selected_llm, groq_api_key)
+    
+    # Don't keep an instance without an index cached, so later reruns retry loading it
+    if not rag_app.index:
+        get_rag.clear(pdf_path, selected_llm, groq_api_key)
     
     # Chat interface
     st.subheader("Chat with the RAG Model")
@@ -31,9 +58,15 @@ def main():
     if st.button("Submit"):
         if query:
             try:
-                response = rag_app.query(query)
-                st.markdown('**Response:**')
-                st.write(response, height=200, disabled=True)
+                with st.chat_message("assistant"):
+                    placeholder = st.empty()
+                    response = ""
+                    # Re-render every few tokens rather than on each one
+                    for i, token in enumerate(rag_app.stream_query(query), start=1):
+                        response += token
+                        if i % TOKENS_PER_RENDER == 0:
+                            placeholder.markdown(response)
+                    placeholder.markdown(response)
             except Exception as e:
                 st.error(f"An error occurred: {e}")
         else:
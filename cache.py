@@ -0,0 +1,192 @@
+import functools
+import hashlib
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import diskcache
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+
+class SemanticCache:
+    """
+    Cache of query responses keyed by query embedding, using random-projection
+    LSH to find previously answered queries that are cosine-similar. Holds at most
+    max_entries responses, evicting the oldest first.
+    """
+
+    def __init__(
+        self,
+        dim: int = 384,
+        num_tables: int = 8,
+        num_bits: int = 16,
+        threshold: float = 0.97,
+        max_candidates: int = 32,
+        max_entries: int = 10000,
+        seed: int = 0
+    ):
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.max_entries = max_entries
+
+        # Hyperplanes are fixed up front so every entry is hashed with the same ones
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((num_tables, num_bits, dim)).astype(np.float32)
+        self._powers = 1 << np.arange(num_bits, dtype=np.int64)
+
+        # Cached (unit embedding, response, bucket keys) by entry id in insertion order,
+        # and the LSH buckets pointing into them. The instance may be shared between
+        # threads (e.g. Streamlit sessions), so access goes through a lock.
+        self._entries: OrderedDict[int, Tuple[np.ndarray, str, List[int]]] = OrderedDict()
+        self._buckets: List[Dict[int, List[int]]] = [defaultdict(list) for _ in range(num_tables)]
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _normalize(self, embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _hash(self, vector: np.ndarray) -> List[int]:
+        """
+        Return one bucket key per hash table for the given unit vector
+        """
+        bits = (self._planes @ vector) > 0
+        return (bits.astype(np.int64) @ self._powers).tolist()
+
+    def lookup(self, embedding: Sequence[float]) -> Optional[str]:
+        """
+        Return the cached response for the most similar query, if it is similar enough
+        """
+        vector = self._normalize(embedding)
+        keys = self._hash(vector)
+
+        with self._lock:
+            if not self._entries:
+                return None
+
+            candidates = []
+            seen = set()
+            for table, key in zip(self._buckets, keys):
+                for entry_id in table.get(key, ()):
+                    if entry_id not in seen:
+                        seen.add(entry_id)
+                        candidates.append(entry_id)
+                if len(candidates) >= self.max_candidates:
+                    break
+            if not candidates:
+                return None
+
+            candidates = candidates[:self.max_candidates]
+            similarities = np.stack([self._entries[i][0] for i in candidates]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return self._entries[candidates[best]][1]
+            return None
+
+    def insert(self, embedding: Sequence[float], response: str) -> None:
+        """
+        Add a query embedding and its response to the cache, evicting the oldest
+        entry once the cache is full
+        """
+        vector = self._normalize(embedding)
+        keys = self._hash(vector)
+
+        with self._lock:
+            while len(self._entries) >= self.max_entries:
+                old_id, (_, _, old_keys) = self._entries.popitem(last=False)
+                for table, key in zip(self._buckets, old_keys):
+                    table[key].remove(old_id)
+                    if not table[key]:
+                        del table[key]
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (vector, response, keys)
+            for table, key in zip(self._buckets, keys):
+                table[key].append(entry_id)
+
+    def clear(self) -> None:
+        """
+        Remove all cached responses
+        """
+        with self._lock:
+            self._entries.clear()
+            for table in self._buckets:
+                table.clear()
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model proxy that caches query embeddings in memory and on disk,
+    keyed by the SHA-256 of the normalized query string
+    """
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _disk_cache: diskcache.Cache = PrivateAttr()
+    _lookup = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache_dir: Optional[str] = None,
+        maxsize: int = 4096
+    ):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            callback_manager=embed_model.callback_manager
+        )
+        self._embed_model = embed_model
+        self._disk_cache = diskcache.Cache(cache_dir or os.path.join(os.getcwd(), 'emb_cache'))
+        self._lookup = functools.lru_cache(maxsize=maxsize)(self._load_query_embedding)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return text.strip().lower()
+
+    def _cache_key(self, text: str) -> str:
+        # The wrapped class is part of the key so swapping implementations of the same
+        # model (e.g. fp32 PyTorch vs int8 ONNX) does not serve stale vectors
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        return f"{self._embed_model.class_name()}:{self.model_name}:{digest}"
+
+    def _load_query_embedding(self, text: str) -> Tuple[float, ...]:
+        """
+        Fetch a query embedding from disk, computing and persisting it on a miss
+        """
+        key = self._cache_key(text)
+        data = self._disk_cache.get(key)
+        if data is not None:
+            return tuple(np.frombuffer(data, dtype=np.float16).astype(np.float32).tolist())
+        embedding = self._embed_model.get_query_embedding(text)
+        # Stored as float16 to halve the on-disk footprint
+        self._disk_cache.set(key, np.asarray(embedding, dtype=np.float16).tobytes())
+        return tuple(embedding)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return list(self._lookup(self._normalize(query)))
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed_model.get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_model.get_text_embedding_batch(texts)
+
+    def get_text_embedding_batch(
+        self,
+        texts: List[str],
+        show_progress: bool = False,
+        **kwargs: Any
+    ) -> List[List[float]]:
+        # Hand the whole batch to the wrapped model so it sees a single call
+        return self._embed_model.get_text_embedding_batch(texts, show_progress=show_progress, **kwargs)
@@ -0,0 +1,83 @@
+import hashlib
+from typing import List, Optional
+
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.prompts import ChatPromptTemplate
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+# Retrieved context goes in its own system message after the instructions and before
+# the user query, so that the prompt prefix is as stable as possible across queries
+CONTEXT_QA_PROMPT = ChatPromptTemplate(message_templates=[
+    ChatMessage(
+        role=MessageRole.SYSTEM,
+        content=(
+            "Context information is below. Each chunk is wrapped in <chunk> tags.\n"
+            "---------------------\n"
+            "{context_str}\n"
+            "---------------------"
+        )
+    ),
+    ChatMessage(role=MessageRole.USER, content="{query_str}")
+])
+
+def chunk_id(text: str) -> str:
+    """
+    Return a short stable identifier for a chunk of text, ignoring case and whitespace
+    """
+    normalized = " ".join(text.lower().split())
+    return hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+
+class ChunkDedupPostprocessor(BaseNodePostprocessor):
+    """
+    Drop retrieved chunks whose normalized text duplicates a higher-ranked chunk,
+    so the same content is not sent to the LLM twice in one prompt
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ChunkDedupPostprocessor"
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None
+    ) -> List[NodeWithScore]:
+        seen = set()
+        unique = []
+        for node in nodes:
+            cid = chunk_id(node.node.get_content())
+            if cid not in seen:
+                seen.add(cid)
+                unique.append(node)
+        return unique
+
+class ChunkOrderPostprocessor(BaseNodePostprocessor):
+    """
+    Order retrieved chunks by content hash rather than similarity score and wrap each
+    in a <chunk> sentinel, so that recurring chunks land in the same prompt positions
+    and LLM prefix caches can reuse them across queries
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ChunkOrderPostprocessor"
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None
+    ) -> List[NodeWithScore]:
+        ordered = []
+        for node in nodes:
+            cid = chunk_id(node.node.get_content())
+            # The sentinel goes into the text itself, since text_template is only applied to
+            # nodes with metadata. Metadata is rendered inside it and then excluded for the LLM.
+            content = node.node.get_content(metadata_mode=MetadataMode.LLM)
+            wrapped = node.node.model_copy(update={
+                'text': f'<chunk id="{cid}">\n{content}\n</chunk>',
+                'excluded_llm_metadata_keys': list(node.node.metadata)
+            })
+            ordered.append((cid, NodeWithScore(node=wrapped, score=node.score)))
+        ordered.sort(key=lambda item: item[0])
+        return [node for _, node in ordered]
@@ -0,0 +1,260 @@
+import hashlib
+import os
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+import numpy as np
+import onnxruntime
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.embeddings.huggingface.utils import format_query, format_text
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer
+
+class TokenCache:
+    """
+    Persistent cache of padded token IDs and attention masks keyed by text hash,
+    stored as memory-mapped int32 arrays so repeated indexing skips tokenization.
+    New entries are buffered in memory until flush() writes them out.
+    """
+
+    def __init__(self, cache_dir: str, max_length: int):
+        self.max_length = max_length
+        self._keys_path = os.path.join(cache_dir, 'tokens_keys.npy')
+        self._tokens_path = os.path.join(cache_dir, 'tokens.npy')
+
+        # tokens has shape (num_texts, 2, max_length): input_ids and attention_mask per text.
+        # Keys are hex digests, since fixed-width bytes arrays drop trailing null bytes.
+        self._keys = np.empty(0, dtype='U32')
+        self._tokens = np.empty((0, 2, max_length), dtype=np.int32)
+        if os.path.exists(self._keys_path) and os.path.exists(self._tokens_path):
+            keys = np.load(self._keys_path)
+            tokens = np.load(self._tokens_path, mmap_mode='r')
+            if keys.dtype == self._keys.dtype and tokens.shape[2] == max_length:
+                self._keys = keys
+                self._tokens = tokens
+        self._rows = {key: row for row, key in enumerate(self._keys.tolist())}
+        self._new: Dict[str, np.ndarray] = {}
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+    def get(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Return the cached (2, max_length) token array for each key, or None on a miss.
+        Rows are copied out so no views into the memory-mapped file escape.
+        """
+        tokens = []
+        for key in keys:
+            if key in self._new:
+                tokens.append(self._new[key])
+            elif key in self._rows:
+                tokens.append(np.array(self._tokens[self._rows[key]]))
+            else:
+                tokens.append(None)
+        return tokens
+
+    def add(self, keys: List[str], tokens: np.ndarray) -> None:
+        """
+        Buffer newly tokenized texts until the next flush
+        """
+        for key, token_array in zip(keys, tokens.astype(np.int32)):
+            self._new[key] = token_array
+
+    def flush(self, retain: Optional[Collection[str]] = None) -> None:
+        """
+        Write buffered entries to disk. When retain is given, stored entries whose keys
+        are not in it are dropped, e.g. after a full rebuild of the corpus. The memory
+        map is released before the files are replaced, since a mapped file cannot be
+        overwritten on Windows.
+        """
+        if retain is None:
+            kept_rows = list(self._rows.values())
+        else:
+            retain = set(retain)
+            kept_rows = [row for key, row in self._rows.items() if key in retain]
+        if not self._new and len(kept_rows) == len(self._rows):
+            return
+        keys = np.concatenate([self._keys[kept_rows], np.array(list(self._new), dtype='U32')])
+        tokens = np.concatenate([
+            np.asarray(self._tokens)[kept_rows],
+            np.stack(list(self._new.values())) if self._new else self._tokens[:0]
+        ])
+        self._tokens = tokens
+
+        for path, array in ((self._keys_path, keys), (self._tokens_path, tokens)):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+
+        self._keys = keys
+        self._tokens = np.load(self._tokens_path, mmap_mode='r')
+        self._rows = {key: row for row, key in enumerate(self._keys.tolist())}
+        self._new.clear()
+
+class OnnxEmbedding(BaseEmbedding):
+    """
+    Embedding model served by ONNX Runtime with int8 dynamically quantized weights.
+    Produces the same CLS-pooled, normalized vectors as HuggingFaceEmbedding for BGE
+    models, so existing indexes remain compatible.
+    """
+    max_length: int = Field(default=512, description="Maximum number of tokens per input.")
+    model_dir: str = Field(description="Directory holding the quantized ONNX model.")
+
+    _model: ORTModelForFeatureExtraction = PrivateAttr()
+    _tokenizer = PrivateAttr()
+    _token_cache: Optional[TokenCache] = PrivateAttr()
+
+    def __init__(
+        self,
+        model_name: str = "BAAI/bge-small-en-v1.5",
+        cache_folder: Optional[str] = None,
+        embed_batch_size: int = 32,
+        max_length: int = 512,
+        num_threads: Optional[int] = None,
+        token_cache_dir: Optional[str] = None,
+        callback_manager: Optional[CallbackManager] = None
+    ):
+        # Quantized models are exported once and reused from disk afterwards
+        cache_folder = cache_folder or os.path.join(os.getcwd(), 'onnx_models')
+        model_dir = os.path.join(cache_folder, f"{model_name.replace('/', '__')}-int8")
+        if not os.path.exists(os.path.join(model_dir, 'model_quantized.onnx')):
+            self._quantize(model_name, model_dir)
+
+        super().__init__(
+            model_name=model_name,
+            embed_batch_size=embed_batch_size,
+            callback_manager=callback_manager,
+            max_length=max_length,
+            model_dir=model_dir
+        )
+
+        # 0 keeps ONNX Runtime's default of one intra-op thread per physical core
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = num_threads or 0
+        self._model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir,
+            file_name='model_quantized.onnx',
+            provider='CPUExecutionProvider',
+            session_options=session_options
+        )
+        self._tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        # Document chunk tokens are cached next to the index when a directory is given
+        self._token_cache = TokenCache(token_cache_dir, max_length) if token_cache_dir else None
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    @staticmethod
+    def _quantize(model_name: str, model_dir: str) -> None:
+        """
+        Export the model to ONNX and quantize its weights to int8 for AVX-512 VNNI
+        """
+        print(f"Exporting and quantizing {model_name} to {model_dir}...")
+        model = ORTModelForFeatureExtraction.from_pretrained(
+            model_name,
+            export=True,
+            provider='CPUExecutionProvider'
+        )
+        quantizer = ORTQuantizer.from_pretrained(model)
+        quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=model_dir, quantization_config=quantization_config)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+
+    def _token_cache_key(self, text: str) -> str:
+        return TokenCache.key(f"{self.model_name}:{text}")
+
+    def _tokenize(self, texts: List[str], use_token_cache: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tokenize texts into input_ids and attention_mask, optionally through the token cache
+        """
+        if not use_token_cache or self._token_cache is None:
+            inputs = self._tokenizer(
+                texts,
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors='np'
+            )
+            return inputs['input_ids'], inputs['attention_mask']
+
+        keys = [self._token_cache_key(text) for text in texts]
+        tokens = self._token_cache.get(keys)
+        misses = [i for i, cached in enumerate(tokens) if cached is None]
+        if misses:
+            inputs = self._tokenizer(
+                [texts[i] for i in misses],
+                padding='max_length',
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors='np'
+            )
+            new_tokens = np.stack([inputs['input_ids'], inputs['attention_mask']], axis=1)
+            self._token_cache.add([keys[i] for i in misses], new_tokens)
+            for i, token_array in zip(misses, new_tokens):
+                tokens[i] = token_array
+
+        # Trim the max_length padding down to the longest text in the batch
+        tokens = np.stack(tokens).astype(np.int64)
+        seq_len = int(tokens[:, 1].sum(axis=1).max())
+        return tokens[:, 0, :seq_len], tokens[:, 1, :seq_len]
+
+    def _embed(self, texts: List[str], use_token_cache: bool = False) -> List[List[float]]:
+        input_ids, attention_mask = self._tokenize(texts, use_token_cache)
+        outputs = self._model(input_ids=input_ids, attention_mask=attention_mask)
+
+        # BGE models use the CLS token as the sentence embedding
+        embeddings = outputs.last_hidden_state[:, 0]
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings.tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed([format_query(query, self.model_name)])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        # Single texts bypass the token cache, which is only flushed by the batch methods
+        return self._embed([format_text(text, self.model_name)])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(
+            [format_text(text, self.model_name) for text in texts],
+            use_token_cache=True
+        )
+
+    def get_text_embedding_batch(
+        self,
+        texts: List[str],
+        show_progress: bool = False,
+        prune_token_cache: bool = False,
+        **kwargs: Any
+    ) -> List[List[float]]:
+        """
+        Embed texts, persisting newly tokenized chunks once per call rather than once per
+        batch. With prune_token_cache, texts is taken to be the whole corpus and cached
+        tokens of any other text are dropped.
+        """
+        embeddings = super().get_text_embedding_batch(texts, show_progress=show_progress, **kwargs)
+        if self._token_cache is not None:
+            retain = None
+            if prune_token_cache:
+                retain = [self._token_cache_key(format_text(text, self.model_name)) for text in texts]
+            self._token_cache.flush(retain)
+        return embeddings
+
+    async def aget_text_embedding_batch(
+        self,
+        texts: List[str],
+        show_progress: bool = False
+    ) -> List[List[float]]:
+        embeddings = await super().aget_text_embedding_batch(texts, show_progress=show_progress)
+        if self._token_cache is not None:
+            self._token_cache.flush()
+        return embeddings
@@ -1,11 +1,38 @@
+import asyncio
 import os
 import sys
+import ahocorasick
+import numba
 import numpy as np
 from sklearn.metrics import accuracy_score, f1_score
 
 from config import GROQ_API_KEY
 from main import RAGApplication
 
+@numba.njit(parallel=True, cache=True)
+def _score_batch(keyword_hits, keyword_counts, is_relevant):
+    """
+    Score a batch of test cases in parallel
+    - keyword_hits: uint8 matrix of shape (cases, max keywords), 1 where a keyword was found
+    - keyword_counts: number of expected keywords per case
+    - is_relevant: whether each case is expected to have a relevant answer
+    Returns keyword hit rates and response relevance flags
+    """
+    num_cases = keyword_hits.shape[0]
+    hit_rates = np.zeros(num_cases, dtype=np.float64)
+    relevance_flags = np.zeros(num_cases, dtype=np.bool_)
+    for i in numba.prange(num_cases):
+        hits = np.uint32(0)
+        for j in range(keyword_counts[i]):
+            hits += keyword_hits[i, j]
+        if keyword_counts[i] > 0:
+            hit_rates[i] = hits / keyword_counts[i]
+        if is_relevant[i]:
+            relevance_flags[i] = hit_rates[i] > 0
+        else:
+            relevance_flags[i] = hit_rates[i] == 0
+    return hit_rates, relevance_flags
+
 class RAGEvaluator:
     def __init__(self, pdf_path: str, api_key: str):
         """
@@ -22,6 +49,9 @@ class RAGEvaluator:
         
         # Ground truth and test cases
         self.ground_truth = self._prepare_ground_truth()
+        
+        # Match every expected keyword in a single pass over each response
+        self._automaton = self._build_automaton()
 
     def _prepare_ground_truth(self):
         """
@@ -64,30 +94,51 @@ class RAGEvaluator:
             }
         ]
 
-    def _evaluate_response(self, response: str, test_case: dict) -> dict:
+    def _build_automaton(self) -> ahocorasick.Automaton:
         """
-        Evaluate individual response
+        Build an Aho-Corasick automaton over all lowercased expected keywords
         """
-        # Check if response contains expected keywords
-        keyword_hits = [
-            keyword.lower() in response.lower() 
-            for keyword in test_case['expected_keywords']
-        ]
+        automaton = ahocorasick.Automaton()
+        for test_case in self.ground_truth:
+            for keyword in test_case['expected_keywords']:
+                automaton.add_word(keyword.lower(), keyword.lower())
+        automaton.make_automaton()
+        return automaton
+
+    def _keyword_hits(self, response: str, test_case: dict) -> list:
+        """
+        Check which expected keywords appear in the response
+        """
+        if not test_case['expected_keywords']:
+            return []
         
-        # Calculate hit rate for keywords
-        keyword_hit_rate = np.mean(keyword_hits) if test_case['expected_keywords'] else 0
+        # Find all expected keywords present in the response
+        found_keywords = {keyword for _, keyword in self._automaton.iter(response.lower())}
+        return [keyword.lower() in found_keywords for keyword in test_case['expected_keywords']]
+
+    def _evaluate_responses(self, responses: list, test_cases: list) -> list:
+        """
+        Evaluate a batch of responses against their test cases
+        """
+        # Pack keyword hits into a zero-padded matrix for the scoring kernel
+        max_keywords = max((len(tc['expected_keywords']) for tc in test_cases), default=0)
+        keyword_hits = np.zeros((len(test_cases), max_keywords), dtype=np.uint8)
+        for i, (response, test_case) in enumerate(zip(responses, test_cases)):
+            hits = self._keyword_hits(response, test_case)
+            keyword_hits[i, :len(hits)] = hits
+        keyword_counts = np.array([len(tc['expected_keywords']) for tc in test_cases], dtype=np.int64)
+        is_relevant = np.array([tc['is_relevant'] for tc in test_cases], dtype=np.bool_)
         
-        # Relevance check
-        is_response_relevant = (
-            (test_case['is_relevant'] and keyword_hit_rate > 0) or 
-            (not test_case['is_relevant'] and keyword_hit_rate == 0)
-        )
+        hit_rates, relevance_flags = _score_batch(keyword_hits, keyword_counts, is_relevant)
         
-        return {
-            'response': response,
-            'keyword_hit_rate': keyword_hit_rate,
-            'is_response_relevant': is_response_relevant
-        }
+        return [
+            {
+                'response': response,
+                'keyword_hit_rate': float(hit_rate),
+                'is_response_relevant': bool(is_response_relevant)
+            }
+            for response, hit_rate, is_response_relevant in zip(responses, hit_rates, relevance_flags)
+        ]
 
     def run_evaluation(self):
         """
@@ -100,33 +151,39 @@ class RAGEvaluator:
         y_true = []
         y_pred = []
         
-        # Iterate through test cases
-        for test_case in self.ground_truth:
+        # Get RAG responses for all test cases in one batch
+        queries = [test_case['query'] for test_case in self.ground_truth]
+        responses = asyncio.run(self.rag_app.abatch_query(queries))
+        
+        answered = []
+        for test_case, response in zip(self.ground_truth, responses):
+            if isinstance(response, Exception):
+                print(f"Error evaluating query '{test_case['query']}': {response}")
+                continue
+            answered.append((test_case, response))
+        
+        # Evaluate all responses in one batch
+        eval_results = self._evaluate_responses(
+            [response for _, response in answered],
+            [test_case for test_case, _ in answered]
+        )
+        
+        for (test_case, response), eval_result in zip(answered, eval_results):
             query = test_case['query']
             
-            try:
-                # Get RAG response
-                response = self.rag_app.query(query)
-                
-                # Evaluate response
-                eval_result = self._evaluate_response(response, test_case)
-                
-                # Store full evaluation result
-                eval_result['query'] = query
-                results.append(eval_result)
-                
-                # For accuracy and F1 calculation
-                y_true.append(test_case['is_relevant'])
-                y_pred.append(eval_result['is_response_relevant'])
-                
-                # Print individual result
-                print(f"Query: {query}")
-                print(f"Response: {response}")
-                print(f"Keyword Hit Rate: {eval_result['keyword_hit_rate']:.2f}")
-                print(f"Relevance: {eval_result['is_relevant']}\n")
+            # Store full evaluation result
+            eval_result['query'] = query
+            results.append(eval_result)
+            
+            # For accuracy and F1 calculation
+            y_true.append(test_case['is_relevant'])
+            y_pred.append(eval_result['is_response_relevant'])
             
-            except Exception as e:
-                print(f"Error evaluating query '{query}': {e}")
+            # Print individual result
+            print(f"Query: {query}")
+            print(f"Response: {response}")
+            print(f"Keyword Hit Rate: {eval_result['keyword_hit_rate']:.2f}")
+            print(f"Relevance: {eval_result['is_response_relevant']}\n")
         
         # Calculate performance metrics
         accuracy = accuracy_score(y_true, y_pred)
@@ -134,7 +191,7 @@ class RAGEvaluator:
         
         # Calculate overall hit rate
         hit_rates = [r['keyword_hit_rate'] for r in results]
-        avg_hit_rate = np.mean(hit_rates)
+        avg_hit_rate = sum(hit_rates) / len(hit_rates) if hit_rates else float('nan')
         
         # Print overall metrics
         print("\n--- Performance Metrics ---")
@@ -1,18 +1,79 @@
+import asyncio
+import functools
 import os
-from typing import Optional
+from typing import Dict, Generator, List, Optional, Tuple, Union
 
+import faiss
+import httpx
+import numpy as np
 from llama_index.core import (
     VectorStoreIndex, 
     SimpleDirectoryReader, 
+    Settings,
     StorageContext, 
     load_index_from_storage
 )
 from llama_index.core.embeddings import BaseEmbedding
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.core.schema import MetadataMode, QueryBundle
+from llama_index.core.vector_stores.simple import (
+    DEFAULT_PERSIST_FNAME, 
+    DEFAULT_VECTOR_STORE, 
+    NAMESPACE_SEP
+)
+from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.llms.groq import Groq
+from llama_index.readers.file import PyMuPDFReader
+from llama_index.vector_stores.faiss import FaissVectorStore
+from cache import CachedEmbedding, SemanticCache
 from config import GROQ_API_KEY
+from context import CONTEXT_QA_PROMPT, ChunkDedupPostprocessor, ChunkOrderPostprocessor
+from embeddings import OnnxEmbedding
+
+# Use uvloop's faster event loop for async LLM calls where it is available (not on Windows)
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
+# FaissVectorStore.persist writes the binary FAISS index under the default vector store name
+FAISS_INDEX_FNAME = f"{DEFAULT_VECTOR_STORE}{NAMESPACE_SEP}{DEFAULT_PERSIST_FNAME}"
+TMP_SUFFIX = '.tmp'
+
+# One keep-alive HTTP/2 connection pool shared by every Groq LLM in the process, so
+# repeated RAGApplication instances and queries do not pay for new TLS handshakes
+HTTP_CLIENT = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=300)
+)
+
+@functools.lru_cache(maxsize=4)
+def _read_faiss_index(storage_dir: str) -> faiss.Index:
+    """
+    Read the persisted FAISS index, sharing one handle per storage directory. FAISS only
+    memory-maps the inverted lists of IVF indexes; any other index type (e.g. a flat index
+    persisted by an older version) is read into memory and shared only within the process.
+    """
+    return faiss.read_index(
+        os.path.join(storage_dir, FAISS_INDEX_FNAME),
+        faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    )
 
 class RAGApplication:
+    DEFAULT_TOP_K = 5
+
+    # FAISS index parameters for the 384-dimensional bge-small embeddings: IVF-PQ for
+    # large corpora, a single exhaustive inverted list for small ones
+    EMBED_DIM = 384
+    FAISS_FACTORY = "IVF256,PQ48x8"
+    IVF_NPROBE = 8
+    # FAISS needs ~39 training points per centroid (256 IVF lists / 256 PQ codes); smaller
+    # corpora such as the dashboards book (~460 chunks) use SMALL_FAISS_FACTORY instead
+    IVF_PQ_MIN_TRAIN = 39 * 256
+    # A single uncompressed inverted list searches exhaustively like IndexFlatIP, but
+    # unlike a flat index its vectors can be memory-mapped when the index is loaded
+    SMALL_FAISS_FACTORY = "IVF1,Flat"
+
     INSTRUCTIONS = (
         """
         You are an expert on Data Visualization. You will answer questions primarily from the context provided. 
@@ -57,15 +118,13 @@ class RAGApplication:
         # Retrieve Groq API Key from multiple sources
         self.groq_api_key = self._get_groq_api_key(groq_api_key)
         
-        # Set up embedding model
-        self.embed_model = embed_model or HuggingFaceEmbedding(
-            model_name="BAAI/bge-small-en-v1.5"
-        )
-        
-        # Set up LLM
+        # Set up LLM with the instructions as its system prompt so that only the
+        # user query is embedded by the retriever
         self.llm = Groq(
             api_key=self.groq_api_key, 
-            model=llm_model
+            model=llm_model,
+            system_prompt=self.INSTRUCTIONS,
+            http_client=HTTP_CLIENT
         )
         
         # PDF and storage paths
@@ -77,8 +136,24 @@ class RAGApplication:
         # Ensure storage directory exists
         os.makedirs(self.storage_dir, exist_ok=True)
         
+        # Set up embedding model, caching query embeddings in memory and on disk
+        # and document chunk tokens next to the index
+        self.embed_model = CachedEmbedding(embed_model or OnnxEmbedding(
+            model_name="BAAI/bge-small-en-v1.5",
+            token_cache_dir=self.storage_dir
+        ))
+        
+        # Query engines are built once per (similarity_top_k, streaming) and reused across queries
+        self._engine_cache: Dict[Tuple[int, bool], RetrieverQueryEngine] = {}
+        
+        # Responses to previous queries, looked up by query embedding similarity. Answers
+        # depend on how many chunks were retrieved, so there is one cache per similarity_top_k.
+        self._sem_caches: Dict[int, SemanticCache] = {}
+        
         # Load the existing vector store index if available
         self.index = self.load_index()
+        if self.index:
+            self._get_query_engine(self.DEFAULT_TOP_K)
 
     def _get_groq_api_key(self, provided_key: Optional[str] = None) -> str:
         """
@@ -101,8 +176,9 @@ class RAGApplication:
         Load existing vector store index if available
         """
         try:
-            # Rebuild storage context
+            # Rebuild storage context, using the FAISS vector store when one was persisted
             storage_context = StorageContext.from_defaults(
+                vector_store=self._load_vector_store(),
                 persist_dir=self.storage_dir
             )
             
@@ -122,6 +198,46 @@ class RAGApplication:
             print(f"Error loading index: {e}")
             return None
 
+    def _load_vector_store(self) -> Optional[FaissVectorStore]:
+        """
+        Load the persisted FAISS vector store, or None for a legacy JSON vector store
+        """
+        faiss_index_path = os.path.join(self.storage_dir, FAISS_INDEX_FNAME)
+        if not os.path.exists(faiss_index_path):
+            return None
+        # Indexes persisted before the switch to FAISS are plain JSON
+        with open(faiss_index_path, 'rb') as f:
+            if f.read(1) == b'{':
+                print("Found legacy JSON vector store, loading without FAISS.")
+                return None
+        faiss_index = _read_faiss_index(os.path.abspath(self.storage_dir))
+        self._set_search_params(faiss_index)
+        return FaissVectorStore(faiss_index=faiss_index)
+
+    def _set_search_params(self, faiss_index: faiss.Index) -> None:
+        """
+        Set query-time search parameters on an IVF index
+        """
+        ivf_index = faiss.try_extract_index_ivf(faiss_index)
+        if ivf_index is not None:
+            ivf_index.nprobe = self.IVF_NPROBE
+
+    def _create_vector_store(self, embeddings: np.ndarray) -> FaissVectorStore:
+        """
+        Create a FAISS vector store trained on the given chunk embeddings: IVF-PQ when there
+        are at least IVF_PQ_MIN_TRAIN chunks, otherwise an exact single-list IVF index
+        """
+        factory = self.FAISS_FACTORY
+        if len(embeddings) < self.IVF_PQ_MIN_TRAIN:
+            print(f"Only {len(embeddings)} chunks, using {self.SMALL_FAISS_FACTORY} instead of {self.FAISS_FACTORY}.")
+            factory = self.SMALL_FAISS_FACTORY
+
+        print(f"Training FAISS {factory} index on {len(embeddings)} chunk embeddings...")
+        faiss_index = faiss.index_factory(self.EMBED_DIM, factory, faiss.METRIC_INNER_PRODUCT)
+        faiss_index.train(embeddings)
+        self._set_search_params(faiss_index)
+        return FaissVectorStore(faiss_index=faiss_index)
+
     def create_index(self) -> VectorStoreIndex:
         """
         Create a vector store index from the PDF document
@@ -132,16 +248,37 @@ class RAGApplication:
             if not os.path.exists(self.pdf_path):
                 raise FileNotFoundError(f"PDF file not found at path: {self.pdf_path}")
             
-            documents = SimpleDirectoryReader(input_files=[self.pdf_path]).load_data()
+            # PyMuPDF extracts text in C, considerably faster than the default pypdf reader
+            documents = SimpleDirectoryReader(
+                input_files=[self.pdf_path],
+                file_extractor={".pdf": PyMuPDFReader()}
+            ).load_data()
             if not documents:
                 raise ValueError("No documents were loaded from the provided PDF. The file may be empty or improperly formatted.")
             print(f"PDF document read successfully. Number of documents loaded: {len(documents)}")
             print(f"Document sample: {documents[0] if documents else 'No documents'}")
 
+            # Split documents into chunks and embed them in batches of embed_batch_size
+            # up front, since the FAISS index must be trained before vectors are added
+            nodes = Settings.node_parser.get_nodes_from_documents(documents, show_progress=True)
+            print(f"Embedding {len(nodes)} chunks (embed_batch_size={self.embed_model.embed_batch_size})...")
+            # This is the full corpus, so token cache entries of stale chunks can be dropped
+            embeddings = self.embed_model.get_text_embedding_batch(
+                [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes],
+                show_progress=True,
+                prune_token_cache=True
+            )
+            for node, embedding in zip(nodes, embeddings):
+                node.embedding = embedding
+
             # Create vector store index
             print("Creating vector store index...")
-            self.index = VectorStoreIndex.from_documents(
-                documents, 
+            storage_context = StorageContext.from_defaults(
+                vector_store=self._create_vector_store(np.array(embeddings, dtype=np.float32))
+            )
+            self.index = VectorStoreIndex(
+                nodes, 
+                storage_context=storage_context,
                 embed_model=self.embed_model,
                 llm=self.llm
             )
@@ -151,10 +288,28 @@ class RAGApplication:
                 raise Exception("Index creation failed. The resulting index object is None.")
             print("Index created successfully.")
 
+            # Drop query engines bound to any previous index
+            self._engine_cache.clear()
+            self._sem_caches.clear()
+            self._get_query_engine(self.DEFAULT_TOP_K)
+
             # Attempt to persist the index
             print("Attempting to persist the index to storage directory...")
             try:
-                self.index.storage_context.persist(persist_dir=self.storage_dir)
+                # Vector stores are written to temporary files first, since the current
+                # FAISS index file may still be memory-mapped and cannot be overwritten in place
+                storage_context = self.index.storage_context
+                storage_context.persist(
+                    persist_dir=self.storage_dir,
+                    vector_store_fname=f"{DEFAULT_PERSIST_FNAME}{TMP_SUFFIX}"
+                )
+                _read_faiss_index.cache_clear()
+                for vector_store_name in storage_context.vector_stores:
+                    vector_store_path = os.path.join(
+                        self.storage_dir,
+                        f"{vector_store_name}{NAMESPACE_SEP}{DEFAULT_PERSIST_FNAME}"
+                    )
+                    os.replace(f"{vector_store_path}{TMP_SUFFIX}", vector_store_path)
                 print(f"Index persisted to storage directory: {self.storage_dir}.")
             except Exception as e:
                 print(f"Persistence failed: {e}")
@@ -171,29 +326,137 @@ class RAGApplication:
             print(f"Error during index creation or persistence: {e}")
             raise
 
-    def query(self, query_str: str, similarity_top_k: int = 5) -> str:
+    def _get_query_engine(self, similarity_top_k: int, streaming: bool = False) -> RetrieverQueryEngine:
         """
-        Query the RAG system
+        Return the query engine for the given top-k and streaming mode, building it on first use
+        """
+        key = (similarity_top_k, streaming)
+        query_engine = self._engine_cache.get(key)
+        if query_engine is None:
+            print(f"Creating query engine (similarity_top_k={similarity_top_k}, streaming={streaming})...")
+            query_engine = self.index.as_query_engine(
+                llm=self.llm,
+                similarity_top_k=similarity_top_k,
+                streaming=streaming,
+                text_qa_template=CONTEXT_QA_PROMPT,
+                node_postprocessors=[ChunkDedupPostprocessor(), ChunkOrderPostprocessor()]
+            )
+            self._engine_cache[key] = query_engine
+        return query_engine
+
+    def _get_sem_cache(self, similarity_top_k: int) -> SemanticCache:
+        """
+        Return the semantic cache for responses built from similarity_top_k chunks
+        """
+        sem_cache = self._sem_caches.get(similarity_top_k)
+        if sem_cache is None:
+            sem_cache = SemanticCache(dim=self.EMBED_DIM)
+            self._sem_caches[similarity_top_k] = sem_cache
+        return sem_cache
+
+    def _lookup_cache(self, query_str: str, similarity_top_k: int) -> Tuple[QueryBundle, Optional[str]]:
+        """
+        Embed the query and look it up in the semantic cache for the given top-k. Returns
+        the query bundle, carrying the embedding so the retriever does not recompute it,
+        and the cached response if a similar query was already asked.
         """
         if not self.index:
             raise ValueError("Index is not available. Please create the index first.")
         
-        # Create query engine
-        print("Creating query engine...")
-        query_engine = self.index.as_query_engine(
-            llm=self.llm,
-            similarity_top_k=similarity_top_k
-        )
+        query_embedding = self.embed_model.get_query_embedding(query_str)
+        cached_response = self._get_sem_cache(similarity_top_k).lookup(query_embedding)
+        if cached_response is not None:
+            print(f"Semantic cache hit for query: {query_str}")
+        return QueryBundle(query_str=query_str, embedding=query_embedding), cached_response
+
+    def query(self, query_str: str, similarity_top_k: int = DEFAULT_TOP_K) -> str:
+        """
+        Query the RAG system
+        """
+        query_bundle, cached_response = self._lookup_cache(query_str, similarity_top_k)
+        if cached_response is not None:
+            return cached_response
         
-        # Add instructions to the query
-        modified_query = f"{self.INSTRUCTIONS}\n\n{query_str}"
+        # Reuse the cached query engine
+        query_engine = self._get_query_engine(similarity_top_k)
         
         # Execute query
         print(f"Executing query: {query_str}...")
-        response = query_engine.query(modified_query)
+        response = str(query_engine.query(query_bundle))
+        print("Query executed successfully.")
+        
+        self._get_sem_cache(similarity_top_k).insert(query_bundle.embedding, response)
+        return response
+
+    def stream_query(
+        self, 
+        query_str: str, 
+        similarity_top_k: int = DEFAULT_TOP_K
+    ) -> Generator[str, None, None]:
+        """
+        Query the RAG system, yielding response tokens as the LLM produces them
+        """
+        query_bundle, cached_response = self._lookup_cache(query_str, similarity_top_k)
+        if cached_response is not None:
+            yield cached_response
+            return
+        
+        query_engine = self._get_query_engine(similarity_top_k, streaming=True)
+        
+        # Execute query and stream tokens through to the caller
+        print(f"Executing query: {query_str}...")
+        streaming_response = query_engine.query(query_bundle)
+        tokens = []
+        for token in streaming_response.response_gen:
+            tokens.append(token)
+            yield token
         print("Query executed successfully.")
         
-        return str(response)
+        self._get_sem_cache(similarity_top_k).insert(query_bundle.embedding, "".join(tokens))
+
+    async def abatch_query(
+        self, 
+        query_strs: List[str], 
+        similarity_top_k: int = DEFAULT_TOP_K
+    ) -> List[Union[str, Exception]]:
+        """
+        Query the RAG system with several queries at once. Context is retrieved locally
+        for every query first, then all LLM calls are issued together over the LLM's
+        shared async client. Failed queries yield their exception in place of a response.
+        """
+        if not self.index:
+            raise ValueError("Index is not available. Please create the index first.")
+        
+        query_engine = self._get_query_engine(similarity_top_k)
+        responses: List[Union[str, Exception, None]] = [None] * len(query_strs)
+        
+        # Answer from the semantic cache where possible and retrieve context for the rest
+        pending = []
+        for i, query_str in enumerate(query_strs):
+            try:
+                query_bundle, cached_response = self._lookup_cache(query_str, similarity_top_k)
+                if cached_response is not None:
+                    responses[i] = cached_response
+                    continue
+                pending.append((i, query_bundle, query_engine.retrieve(query_bundle)))
+            except Exception as e:
+                responses[i] = e
+        
+        # Synthesize all remaining responses concurrently
+        print(f"Executing {len(pending)} queries...")
+        synthesized = await asyncio.gather(
+            *[query_engine.asynthesize(query_bundle, nodes) for _, query_bundle, nodes in pending],
+            return_exceptions=True
+        )
+        for (i, query_bundle, _), response in zip(pending, synthesized):
+            if isinstance(response, Exception):
+                responses[i] = response
+                continue
+            responses[i] = str(response)
+            self._get_sem_cache(similarity_top_k).insert(query_bundle.embedding, responses[i])
+        print("Queries executed successfully.")
+        
+        return responses
 
 def main():
     # Example usage with flexible API key handling